@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+
+# Profile-guided reordering of the rules within each RULE_TABLE section.
+#
+# Rules are tried first-match-wins, so moving a rule is only safe past rules
+# that can never match at the same position. Each rule's left context, literal
+# and right context are compiled to NFAs, and two rules are kept in their
+# original relative order unless the intersection of their languages is
+# provably empty. Within those constraints, rules are greedily ordered so that
+# the rules the corpus hits most are tried sooner, keeping the original order
+# for any section where that would not reduce the rules tried. The new order is
+# then checked against the original on the corpus and on fuzzed inputs.
+
+import argparse
+import json
+import random
+import sys
+from collections import Counter
+
+from text2sp0256 import (
+    RULE_TABLE,
+    Text2sp0256,
+    expand_meta_rule,
+    reorder_rule_table,
+    rule_table_digest,
+)
+
+# Stands for every character that appears nowhere in RULE_TABLE.
+OTHER = "\0"
+
+
+def table_alphabet(rule_table):
+    alphabet = {OTHER}
+    for section, rules in rule_table.items():
+        alphabet.add(section)
+        for a_rules, b_rules, c_rules, _ in rules:
+            for rule in (a_rules, b_rules, c_rules):
+                alphabet.update(rule)
+                alphabet.update(expand_meta_rule(rule))
+    return frozenset(alphabet)
+
+
+class RegexParser:
+    # Parses the subset of regex syntax the expanded rules use, into a tree of
+    # ("chars", set), ("cat", [nodes]), ("alt", [nodes]), ("rep", node, min,
+    # max) and ("end",) nodes.
+
+    def __init__(self, pattern, alphabet):
+        self.pattern = pattern
+        self.alphabet = alphabet
+        self.pos = 0
+
+    def error(self, msg):
+        return ValueError(f"{msg} at {self.pos} in {self.pattern!r}")
+
+    def peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def next(self):
+        c = self.peek()
+        if c is None:
+            raise self.error("unexpected end")
+        self.pos += 1
+        return c
+
+    def parse(self):
+        node = self.alt()
+        if self.peek() is not None:
+            raise self.error("unexpected character")
+        return node
+
+    def alt(self):
+        nodes = [self.cat()]
+        while self.peek() == "|":
+            self.next()
+            nodes.append(self.cat())
+        return nodes[0] if len(nodes) == 1 else ("alt", nodes)
+
+    def cat(self):
+        nodes = []
+        while self.peek() not in (None, "|", ")"):
+            nodes.append(self.repeat())
+        return ("cat", nodes)
+
+    def repeat(self):
+        node = self.atom()
+        while True:
+            c = self.peek()
+            if c == "*":
+                node = ("rep", node, 0, None)
+            elif c == "+":
+                node = ("rep", node, 1, None)
+            elif c == "?":
+                node = ("rep", node, 0, 1)
+            elif c == "{":
+                self.next()
+                lo, comma, hi = self.until("}").partition(",")
+                lo = int(lo) if lo else 0
+                hi = int(hi) if hi else (None if comma else lo)
+                node = ("rep", node, lo, hi)
+                continue
+            else:
+                return node
+            self.next()
+
+    def until(self, end):
+        chars = []
+        while (c := self.next()) != end:
+            chars.append(c)
+        return "".join(chars)
+
+    def atom(self):
+        c = self.next()
+        if c == "(":
+            node = self.alt()
+            if self.next() != ")":
+                raise self.error("expected )")
+            return node
+        if c == "[":
+            return ("chars", self.chars())
+        if c == "$":
+            return ("end",)
+        if c == ".":
+            return ("chars", self.alphabet)
+        if c == "\\":
+            c = self.next()
+        elif c in "*+?{})|^":
+            raise self.error("unsupported syntax")
+        return ("chars", frozenset(c))
+
+    def chars(self):
+        negate = self.peek() == "^"
+        if negate:
+            self.next()
+        chars = set()
+        while (c := self.next()) != "]":
+            if self.peek() == "-":
+                self.next()
+                chars.update(chr(i) for i in range(ord(c), ord(self.next()) + 1))
+            else:
+                chars.add(c)
+        if negate:
+            return self.alphabet - chars
+        return self.alphabet & chars
+
+
+class NFA:
+    def __init__(self, node):
+        self.eps = {}
+        self.end = {}
+        self.edges = {}
+        self.states = 0
+        self.start, self.accept = self.build(node)
+
+    def state(self):
+        self.states += 1
+        return self.states - 1
+
+    def add(self, edges, src, dst):
+        edges.setdefault(src, []).append(dst)
+
+    def build(self, node):
+        s = self.state()
+        kind = node[0]
+        if kind == "chars":
+            e = self.state()
+            self.edges.setdefault(s, []).append((node[1], e))
+        elif kind == "end":
+            e = self.state()
+            self.add(self.end, s, e)
+        elif kind == "cat":
+            e = s
+            for child in node[1]:
+                cs, ce = self.build(child)
+                self.add(self.eps, e, cs)
+                e = ce
+        elif kind == "alt":
+            e = self.state()
+            for child in node[1]:
+                cs, ce = self.build(child)
+                self.add(self.eps, s, cs)
+                self.add(self.eps, ce, e)
+        elif kind == "rep":
+            _, child, lo, hi = node
+            e = s
+            for _ in range(lo):
+                cs, ce = self.build(child)
+                self.add(self.eps, e, cs)
+                e = ce
+            if hi is None:
+                cs, ce = self.build(child)
+                self.add(self.eps, e, cs)
+                self.add(self.eps, ce, e)
+            else:
+                for _ in range(hi - lo):
+                    cs, ce = self.build(child)
+                    skip = self.state()
+                    self.add(self.eps, e, cs)
+                    self.add(self.eps, e, skip)
+                    self.add(self.eps, ce, skip)
+                    e = skip
+        else:
+            raise ValueError(f"unknown node {kind}")
+        return s, e
+
+
+def intersects(nfa1, nfa2):
+    # Is there a string both NFAs accept? "end" edges may only be followed when
+    # no more characters follow, which holds for both NFAs at once.
+    start = (nfa1.start, nfa2.start, False)
+    seen = {start}
+    todo = [start]
+    while todo:
+        q1, q2, ended = todo.pop()
+        if q1 == nfa1.accept and q2 == nfa2.accept:
+            return True
+        succ = [(n, q2, ended) for n in nfa1.eps.get(q1, [])]
+        succ += [(q1, n, ended) for n in nfa2.eps.get(q2, [])]
+        succ += [(n, q2, True) for n in nfa1.end.get(q1, [])]
+        succ += [(q1, n, True) for n in nfa2.end.get(q2, [])]
+        if not ended:
+            for chars1, n1 in nfa1.edges.get(q1, []):
+                for chars2, n2 in nfa2.edges.get(q2, []):
+                    if chars1 & chars2:
+                        succ.append((n1, n2, False))
+        for s in succ:
+            if s not in seen:
+                seen.add(s)
+                todo.append(s)
+    return False
+
+
+class RuleLanguages:
+    def __init__(self, rule_table):
+        self.alphabet = table_alphabet(rule_table)
+        self.anything = ("rep", ("chars", self.alphabet), 0, None)
+
+    def parse(self, pattern):
+        return RegexParser(pattern, self.alphabet).parse()
+
+    def literal(self, s):
+        return ("cat", [("chars", frozenset(c)) for c in s])
+
+    def left(self, a_rules):
+        # Text2sp0256 matches the whole text before the rule against a_rules.
+        if not a_rules:
+            return self.anything
+        return ("cat", [self.parse(expand_meta_rule(a_rules)), ("end",)])
+
+    def right(self, c_rules):
+        # ...and a prefix of the text after the literal against c_rules.
+        if not c_rules:
+            return self.anything
+        return ("cat", [self.parse(expand_meta_rule(c_rules)), self.anything])
+
+    def overlap(self, rule1, rule2):
+        # Can rule1 and rule2 both match at the same position of some text?
+        a1, b1, c1, _ = rule1
+        a2, b2, c2, _ = rule2
+        if len(b1) > len(b2):
+            a1, b1, c1, a2, b2, c2 = a2, b2, c2, a1, b1, c1
+        if not b2.startswith(b1):
+            return False
+        if not intersects(NFA(self.left(a1)), NFA(self.left(a2))):
+            return False
+        # after b1, rule1 sees the rest of b2 and then whatever rule2 sees.
+        rest = ("cat", [self.literal(b2[len(b1) :]), self.right(c2)])
+        return intersects(NFA(self.right(c1)), NFA(rest))
+
+
+def constraints(rules, languages):
+    # before[j] holds every earlier rule that must still be tried before rule j.
+    before = [set() for _ in rules]
+    for j, rule in enumerate(rules):
+        for i in range(j):
+            if languages.overlap(rules[i], rule):
+                before[j].add(i)
+    return before
+
+
+def order_section(hits, before):
+    # Schedules the available rule whose unscheduled prerequisites give the
+    # most hits per rule tried, along with those prerequisites.
+    scheduled = []
+    done = set()
+
+    def required(j):
+        need = {j}
+        todo = [j]
+        while todo:
+            for i in before[todo.pop()]:
+                if i not in done and i not in need:
+                    need.add(i)
+                    todo.append(i)
+        return need
+
+    while len(scheduled) < len(before):
+        best = None
+        for j in range(len(before)):
+            if j in done:
+                continue
+            need = required(j)
+            ratio = sum(hits[i] for i in need) / len(need)
+            if best is None or ratio > best[0]:
+                best = (ratio, need)
+        for i in sorted(best[1]):
+            scheduled.append(i)
+            done.add(i)
+    return scheduled
+
+
+def cost(hits, order):
+    # rules tried to find each hit, summed over all hits.
+    return sum(hits[i] * (rank + 1) for rank, i in enumerate(order))
+
+
+def check_order(order, before):
+    rank = {j: r for r, j in enumerate(order)}
+    for j, earlier in enumerate(before):
+        for i in earlier:
+            if rank[i] > rank[j]:
+                raise AssertionError(f"rule {i} must be tried before rule {j}")
+
+
+def outcome(translator, input_str):
+    try:
+        return translator.translate(input_str)
+    except (KeyError, ValueError) as err:
+        return type(err)
+
+
+def fuzz_inputs(corpus, count, seed):
+    rnd = random.Random(seed)
+    chars = "".join(RULE_TABLE) + " " * 8
+    words = [w for line in corpus for w in line.split()] or ["A"]
+    for _ in range(count):
+        if rnd.random() < 0.5:
+            yield "".join(rnd.choice(chars) for _ in range(rnd.randint(1, 12)))
+        else:
+            word = list(rnd.choice(words))
+            for _ in range(rnd.randint(1, 3)):
+                word.insert(rnd.randint(0, len(word)), rnd.choice(chars))
+                del word[rnd.randrange(len(word))]
+            yield " " + "".join(word) + " "
+
+
+def profile(translator, corpus):
+    # Counts how often each rule wins, by section and index in translator's
+    # rule table, and the characters translated. Inputs that cannot be
+    # translated are skipped.
+    hits = {section: Counter() for section in RULE_TABLE}
+    chars = 0
+    for input_str in corpus:
+        pos = 0
+        line_hits = []
+        try:
+            while pos < len(input_str):
+                i = translator.match(input_str, pos)
+                line_hits.append((input_str[pos], i))
+                pos += len(translator.RULES[input_str[pos]][i][1])
+        except (KeyError, ValueError):
+            print(f"cannot translate {input_str!r}, skipped", file=sys.stderr)
+            continue
+        for section, i in line_hits:
+            hits[section][i] += 1
+        chars += len(input_str)
+    return hits, chars
+
+
+def reorder(hits, languages):
+    # Returns the order to save, and the rules tried for hits before and after.
+    sections = {}
+    old_cost = 0
+    new_cost = 0
+    for section, rules in RULE_TABLE.items():
+        before = constraints(rules, languages)
+        original = list(range(len(rules)))
+        section_order = order_section(hits[section], before)
+        check_order(section_order, before)
+        if cost(hits[section], section_order) > cost(hits[section], original):
+            section_order = original
+        old_cost += cost(hits[section], original)
+        new_cost += cost(hits[section], section_order)
+        sections[section] = section_order
+    order = {"digest": rule_table_digest(RULE_TABLE), "sections": sections}
+    return order, old_cost, new_cost
+
+
+def read_corpus(paths):
+    corpus = []
+    for path in paths:
+        with open(path) as f:
+            corpus.extend(line.upper().strip() for line in f if line.strip())
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="reorder RULE_TABLE sections by how often a corpus hits each rule"
+    )
+    parser.add_argument("corpus", nargs="+", help="text files to profile")
+    parser.add_argument("-o", "--output", required=True, help="JSON rule order")
+    parser.add_argument(
+        "--fuzz", type=int, default=10000, help="fuzzed inputs to check"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="fuzzing seed")
+    args = parser.parse_args()
+
+    corpus = read_corpus(args.corpus)
+    translator = Text2sp0256()
+    hits, chars = profile(translator, corpus)
+    order, old_cost, new_cost = reorder(hits, RuleLanguages(RULE_TABLE))
+
+    reordered = Text2sp0256(reorder_rule_table(order))
+    checked = 0
+    for input_str in corpus + list(fuzz_inputs(corpus, args.fuzz, args.seed)):
+        if outcome(translator, input_str) != outcome(reordered, input_str):
+            raise AssertionError(f"reordered rules translate {input_str!r} differently")
+        checked += 1
+
+    with open(args.output, "w") as f:
+        json.dump(order, f, indent=2)
+    if chars:
+        print(
+            f"rules tried per character: {old_cost / chars:.2f} -> "
+            f"{new_cost / chars:.2f}",
+            file=sys.stderr,
+        )
+    print(f"{checked} inputs translate identically", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
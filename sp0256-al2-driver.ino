@@ -1,4 +1,6 @@
 // standalone SP0256 driver, that speaks allophones sent over serial port.
+// See sp0256protocol.py for the framed protocol; sp0256sim.py is a reference
+// model of this sketch.
 
 #include "DigitalIO.h"
 
@@ -29,6 +31,45 @@ DigitalPin<SA7> sa7;
 DigitalPin<SA8> sa8;
 DigitalPin<ALD> ald;
 DigitalPin<LRQ> lrq;
+DigitalPin<SBY> sby;
+
+#define PROTOCOL_VERSION 1
+
+#define CMD_HELLO 0x00
+#define CMD_SPEAK 0xC1
+#define CMD_FLUSH 0xC2
+#define CMD_ABORT 0xC3
+#define CMD_STATUS 0xC4
+
+#define RSP_HELLO 0xD0
+#define RSP_ACK 0xD1
+#define RSP_FLUSH 0xD2
+#define RSP_ABORT 0xD3
+#define RSP_STATUS 0xD4
+
+#define ALLOPHONE_MASK 0x3F
+// set on the last allophone of a frame in the buffer.
+#define END_OF_FRAME 0x80
+
+// must be a power of 2, and match BUFFER_SIZE in sp0256protocol.py.
+#define BUFFER_SIZE 64
+#define BUFFER_MASK (BUFFER_SIZE - 1)
+
+byte buffer[BUFFER_SIZE];
+byte buffer_head = 0;
+byte buffer_tail = 0;
+byte buffer_used = 0;
+// sequence numbers of frames in the buffer, one per END_OF_FRAME.
+byte seqs[BUFFER_SIZE];
+byte seqs_head = 0;
+byte seqs_tail = 0;
+// allophones spoken so far from the frame at the front of the buffer.
+byte spoken = 0;
+bool flush_pending = false;
+
+enum { IDLE, SPEAK_SEQ, SPEAK_LEN, SPEAK_DATA } state = IDLE;
+byte frame_seq;
+byte frame_left;
 
 void setup() {
   pinMode(SA1, OUTPUT);
@@ -83,13 +124,121 @@ void speak(byte a) {
   ald.write(HIGH);
 }
 
+void respond(byte rsp, byte a, byte b) {
+  byte data[] = {rsp, a, b};
+  Serial.write(data, sizeof(data));
+}
+
+void ack() {
+  respond(RSP_ACK, seqs[seqs_tail], spoken);
+  seqs_tail = (seqs_tail + 1) & BUFFER_MASK;
+  spoken = 0;
+}
+
+byte pop() {
+  byte b = buffer[buffer_tail];
+  buffer_tail = (buffer_tail + 1) & BUFFER_MASK;
+  --buffer_used;
+  return b;
+}
+
+void push(byte b) {
+  buffer[buffer_head] = b;
+  buffer_head = (buffer_head + 1) & BUFFER_MASK;
+  ++buffer_used;
+}
+
+// speak the next buffered allophone, if the chip is ready for it.
+void service() {
+  if (buffer_used && !lrq.read()) {
+    byte b = pop();
+    speak(b & ALLOPHONE_MASK);
+    ++spoken;
+    if (b & END_OF_FRAME) {
+      ack();
+    }
+  }
+  if (flush_pending && !buffer_used && sby.read()) {
+    flush_pending = false;
+    Serial.write(RSP_FLUSH);
+  }
+}
+
+void receive(byte b) {
+  switch (state) {
+    case SPEAK_SEQ:
+      frame_seq = b;
+      state = SPEAK_LEN;
+      return;
+    case SPEAK_LEN:
+      frame_left = b;
+      if (frame_left) {
+        state = SPEAK_DATA;
+      } else {
+        // an empty frame is acknowledged straight away.
+        respond(RSP_ACK, frame_seq, 0);
+        state = IDLE;
+      }
+      return;
+    case SPEAK_DATA:
+      // the host's credits should make this unreachable.
+      while (buffer_used == BUFFER_SIZE) {
+        service();
+      }
+      if (--frame_left) {
+        push(b & ALLOPHONE_MASK);
+      } else {
+        push((b & ALLOPHONE_MASK) | END_OF_FRAME);
+        seqs[seqs_head] = frame_seq;
+        seqs_head = (seqs_head + 1) & BUFFER_MASK;
+        state = IDLE;
+      }
+      return;
+    default:
+      break;
+  }
+
+  switch (b) {
+    case CMD_HELLO:
+      // CMD_HELLO is PA1, so speak and echo it as the original protocol did.
+      // Anything still buffered is left for the host to abort.
+      speak(b);
+      respond(RSP_HELLO, PROTOCOL_VERSION, BUFFER_SIZE);
+      Serial.write(CMD_HELLO);
+      break;
+    case CMD_SPEAK:
+      state = SPEAK_SEQ;
+      break;
+    case CMD_FLUSH:
+      flush_pending = true;
+      break;
+    case CMD_ABORT:
+      while (buffer_used) {
+        if (pop() & END_OF_FRAME) {
+          ack();
+        }
+      }
+      Serial.write(RSP_ABORT);
+      break;
+    case CMD_STATUS:
+      respond(RSP_STATUS, buffer_used, BUFFER_SIZE - buffer_used);
+      break;
+    default:
+      // original protocol: speak the allophone, and echo it back once it has
+      // been spoken.
+      while (buffer_used) {
+        service();
+      }
+      speak(b);
+      Serial.write(b);
+      Serial.flush();
+      break;
+  }
+}
+
 void loop() {
-  // wait for a byte/allophone to write, write it, and echo back once the allophone
-  // has been spoken.
   while (Serial.available()) {
-    byte b = Serial.read();
-    speak(b);
-    Serial.write(b);
-    Serial.flush();
+    receive(Serial.read());
   }
+  service();
 }
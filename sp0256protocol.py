@@ -0,0 +1,58 @@
+# Framed host/firmware protocol shared by speaksp0256.py and sp0256sim.py, and
+# mirrored in sp0256-al2-driver.ino.
+#
+# Outside a frame, any byte that is not a command is an allophone in the
+# original protocol: the sketch speaks it and echoes it back. That is also what
+# the original sketch does with every byte, so a host can tell the two apart by
+# sending CMD_HELLO and checking whether it gets RSP_HELLO or CMD_HELLO back.
+# CMD_HELLO is PA1, the byte hosts of the original sketch already probed it
+# with, so the original sketch only ever sees a valid allophone, and a short
+# pause is all it speaks. The framed sketch speaks it too and RSP_HELLO ends
+# with CMD_HELLO, so to those hosts PA1 behaves as it always has.
+#
+# Host to firmware:
+#   CMD_HELLO                           -> RSP_HELLO version buffer_size
+#                                          CMD_HELLO
+#   CMD_SPEAK seq length allophones...  -> RSP_ACK seq spoken (once spoken)
+#   CMD_FLUSH                           -> RSP_FLUSH (buffer empty, chip idle)
+#   CMD_ABORT                           -> RSP_ACK for each discarded frame,
+#                                          then RSP_ABORT
+#   CMD_STATUS                          -> RSP_STATUS queued free
+#
+# After RSP_HELLO the host sends CMD_ABORT, discarding anything queued by a
+# previous host on a sketch that was not reset when the port was opened, and
+# ignores the ACKs for it. It then starts with buffer_size credits, spends one
+# per allophone sent and gets back a frame's length when that frame is
+# acknowledged, so the sketch's buffer can never overflow. spoken is less than the frame's length only if
+# the frame was cut short by CMD_ABORT.
+
+PROTOCOL_VERSION = 1
+
+CMD_HELLO = 0x00
+CMD_SPEAK = 0xC1
+CMD_FLUSH = 0xC2
+CMD_ABORT = 0xC3
+CMD_STATUS = 0xC4
+
+RSP_HELLO = 0xD0
+RSP_ACK = 0xD1
+RSP_FLUSH = 0xD2
+RSP_ABORT = 0xD3
+RSP_STATUS = 0xD4
+
+# Payload bytes following each response type.
+RSP_LENGTHS = {
+    RSP_HELLO: 3,
+    RSP_ACK: 2,
+    RSP_FLUSH: 0,
+    RSP_ABORT: 0,
+    RSP_STATUS: 2,
+}
+
+# Allophones the sketch can buffer, and so the host's initial credits.
+BUFFER_SIZE = 64
+
+# Largest length byte in a CMD_SPEAK frame.
+MAX_FRAME = 255
+
+ALLOPHONE_MASK = 0x3F
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+# Reference model of sp0256-al2-driver.ino, served over a pty so speaksp0256.py
+# can be tested without hardware. Spoken allophones are written to stdout as
+# bytes, so they can be compared with what text2sp0256.py produced.
+
+import argparse
+import os
+import select
+import sys
+import time
+import tty
+from collections import deque
+
+from sp0256protocol import (
+    ALLOPHONE_MASK,
+    BUFFER_SIZE,
+    CMD_ABORT,
+    CMD_FLUSH,
+    CMD_HELLO,
+    CMD_SPEAK,
+    CMD_STATUS,
+    PROTOCOL_VERSION,
+    RSP_ABORT,
+    RSP_ACK,
+    RSP_FLUSH,
+    RSP_HELLO,
+    RSP_STATUS,
+)
+
+IDLE, SPEAK_SEQ, SPEAK_LEN, SPEAK_DATA = range(4)
+
+
+class Firmware:
+    def __init__(self, allophone_time, legacy=False, buffer_size=BUFFER_SIZE):
+        self.allophone_time = allophone_time
+        self.legacy = legacy
+        self.buffer_size = buffer_size
+        # (allophone, seq if it ends a frame else None)
+        self.buffer = deque()
+        self.state = IDLE
+        self.frame_seq = 0
+        self.frame_left = 0
+        self.spoken = 0
+        self.flush_pending = False
+        self.busy_until = 0
+        self.said = bytearray()
+
+    def chip_idle(self):
+        return time.monotonic() >= self.busy_until
+
+    def speak(self, a):
+        # the sketch blocks on LRQ, the model on the previous allophone.
+        now = time.monotonic()
+        if now < self.busy_until:
+            time.sleep(self.busy_until - now)
+            now = self.busy_until
+        self.said.append(a)
+        self.busy_until = now + self.allophone_time
+
+    def receive(self, b):
+        if self.legacy:
+            self.speak(b)
+            return bytes([b])
+        if self.state == SPEAK_SEQ:
+            self.frame_seq = b
+            self.state = SPEAK_LEN
+            return b""
+        if self.state == SPEAK_LEN:
+            self.frame_left = b
+            self.state = SPEAK_DATA if b else IDLE
+            # an empty frame is acknowledged straight away.
+            return b"" if b else bytes([RSP_ACK, self.frame_seq, 0])
+        if self.state == SPEAK_DATA:
+            # the host's credits should make this unreachable.
+            out = bytearray()
+            while len(self.buffer) >= self.buffer_size:
+                out += self.service(block=True)
+            self.frame_left -= 1
+            if self.frame_left:
+                self.buffer.append((b & ALLOPHONE_MASK, None))
+            else:
+                self.buffer.append((b & ALLOPHONE_MASK, self.frame_seq))
+                self.state = IDLE
+            return bytes(out)
+        if b == CMD_HELLO:
+            # CMD_HELLO is PA1, so speak and echo it as the original protocol did.
+            # Anything still buffered is left for the host to abort.
+            self.speak(b)
+            return bytes([RSP_HELLO, PROTOCOL_VERSION, self.buffer_size, CMD_HELLO])
+        if b == CMD_SPEAK:
+            self.state = SPEAK_SEQ
+            return b""
+        if b == CMD_FLUSH:
+            self.flush_pending = True
+            return b""
+        if b == CMD_ABORT:
+            out = bytearray()
+            while self.buffer:
+                _, seq = self.buffer.popleft()
+                if seq is not None:
+                    out += bytes([RSP_ACK, seq, self.spoken])
+                    self.spoken = 0
+            out.append(RSP_ABORT)
+            return bytes(out)
+        if b == CMD_STATUS:
+            queued = len(self.buffer)
+            return bytes([RSP_STATUS, queued, self.buffer_size - queued])
+        # original protocol: drain the buffer, speak, echo.
+        out = bytearray()
+        while self.buffer:
+            out += self.service(block=True)
+        self.speak(b)
+        out.append(b)
+        return bytes(out)
+
+    def service(self, block=False):
+        out = bytearray()
+        if self.buffer and (block or self.chip_idle()):
+            a, seq = self.buffer.popleft()
+            self.speak(a)
+            self.spoken += 1
+            if seq is not None:
+                out += bytes([RSP_ACK, seq, self.spoken])
+                self.spoken = 0
+        if self.flush_pending and not self.buffer and self.chip_idle():
+            self.flush_pending = False
+            out.append(RSP_FLUSH)
+        return bytes(out)
+
+    def timeout(self):
+        if self.buffer or self.flush_pending:
+            return max(self.busy_until - time.monotonic(), 0)
+        return None
+
+
+def open_pty():
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    return master, slave
+
+
+def serve(firmware, master, out=None, stop=None):
+    # Spoken allophones are written to out if given, else left in firmware.said.
+    # Returns once stop is set.
+    while stop is None or not stop.is_set():
+        timeout = firmware.timeout()
+        if stop is not None:
+            timeout = 0.01 if timeout is None else min(timeout, 0.01)
+        readable, _, _ = select.select([master], [], [], timeout)
+        reply = bytearray()
+        if readable:
+            for b in os.read(master, 1024):
+                reply += firmware.receive(b)
+        reply += firmware.service()
+        if reply:
+            os.write(master, bytes(reply))
+        if out is not None and firmware.said:
+            out.write(bytes(firmware.said))
+            out.flush()
+            firmware.said.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SP0256 driver sketch reference model")
+    parser.add_argument(
+        "--allophone-ms",
+        type=float,
+        default=50,
+        help="how long the model takes to speak each allophone",
+    )
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="model the original sketch, which echoes every byte",
+    )
+    args = parser.parse_args()
+    master, slave = open_pty()
+    print(os.ttyname(slave), file=sys.stderr, flush=True)
+    firmware = Firmware(args.allophone_ms / 1e3, legacy=args.legacy)
+    serve(firmware, master, sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    main()
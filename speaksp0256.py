@@ -4,27 +4,78 @@ import serial
 import sys
 import time
 
+from sp0256protocol import (
+    CMD_ABORT,
+    CMD_FLUSH,
+    CMD_HELLO,
+    CMD_SPEAK,
+    CMD_STATUS,
+    MAX_FRAME,
+    PROTOCOL_VERSION,
+    RSP_ABORT,
+    RSP_ACK,
+    RSP_FLUSH,
+    RSP_HELLO,
+    RSP_LENGTHS,
+    RSP_STATUS,
+)
+
 PORT = "/dev/ttyACM0"
 SPEED = 115200
+# seconds to wait for an answer to CMD_HELLO, e.g. while the board resets.
+HELLO_RETRY = 0.1
 
 
 class Speaker:
-    def __init__(self):
-        self.port = serial.Serial(PORT, SPEED, timeout=0.001)
+    def __init__(self, port=PORT):
+        self.port = serial.Serial(port, SPEED, timeout=0.001)
         self.port.reset_input_buffer()
-        self.wakeup()
-
-    def wakeup(self):
-        while len(self.port.read(1)):
-            pass
+        self.seq = 0
+        self.pending = {}
+        self.spoken = 0
+        self.framed = self.hello()
 
+    def hello(self):
+        # a sketch that only speaks the original protocol echoes CMD_HELLO.
+        # Anything else left over from a previous session is skipped a whole
+        # response at a time.
         while True:
-            self.port.write(bytes([0]))
-            if self.port.read(1) == b"\x00":
-                break
+            self.port.write(bytes([CMD_HELLO]))
+            deadline = time.monotonic() + HELLO_RETRY
+            while time.monotonic() < deadline:
+                c = self.port.read(1)
+                if not c:
+                    continue
+                if c[0] == CMD_HELLO:
+                    self.drain()
+                    return False
+                if c[0] not in RSP_LENGTHS:
+                    continue
+                payload = self.readexact(RSP_LENGTHS[c[0]])
+                if c[0] == RSP_HELLO:
+                    version, self.buffer_size, _ = payload
+                    self.credits = self.buffer_size
+                    self.drain()
+                    if version != PROTOCOL_VERSION:
+                        return False
+                    # a sketch that was not reset may still hold frames from a
+                    # previous host. Their ACKs are ignored as nothing is pending.
+                    self.port.write(bytes([CMD_ABORT]))
+                    self.wait(RSP_ABORT)
+                    return True
 
-        while len(self.port.read(1)):
-            pass
+    def drain(self):
+        # discard answers to any retried CMD_HELLO.
+        deadline = time.monotonic() + HELLO_RETRY
+        while time.monotonic() < deadline:
+            if len(self.port.read(1)):
+                deadline = time.monotonic() + HELLO_RETRY
+
+    def readexact(self, n):
+        data = b""
+        while len(data) < n:
+            data += self.port.read(n - len(data))
+        return data
 
     def readwait(self, a):
         while True:
@@ -32,18 +83,75 @@ class Speaker:
             if len(c) and c == a:
                 return
 
-    def speak(self, data):
+    def response(self):
+        while True:
+            rsp = self.readexact(1)[0]
+            if rsp in RSP_LENGTHS:
+                break
+        payload = self.readexact(RSP_LENGTHS[rsp])
+        # ACKs for frames from a previous session are ignored.
+        if rsp == RSP_ACK and payload[0] in self.pending:
+            seq, spoken = payload
+            self.credits += self.pending.pop(seq)
+            self.spoken += spoken
+        return rsp, payload
+
+    def wait(self, rsp):
+        while True:
+            r, payload = self.response()
+            if r == rsp:
+                return payload
+
+    def speak_legacy(self, data):
         for b in data:
             b = bytes([b])
             self.port.write(b)
             self.port.flush()
             self.readwait(b)
 
+    def speak(self, data):
+        if not self.framed:
+            self.speak_legacy(data)
+            return
+        while data:
+            # half buffer frames keep one frame queued while another is spoken,
+            # without dribbling out tiny frames as credits come back.
+            n = min(len(data), MAX_FRAME, max(self.buffer_size // 2, 1))
+            while self.credits < n:
+                self.response()
+            self.port.write(bytes([CMD_SPEAK, self.seq, n]) + data[:n])
+            self.pending[self.seq] = n
+            self.credits -= n
+            self.seq = (self.seq + 1) & 0xFF
+            data = data[n:]
+
+    def flush(self):
+        if self.framed:
+            self.port.write(bytes([CMD_FLUSH]))
+            self.wait(RSP_FLUSH)
+
+    def abort(self):
+        if self.framed:
+            self.port.write(bytes([CMD_ABORT]))
+            self.wait(RSP_ABORT)
 
-speaker = Speaker()
+    def status(self):
+        if not self.framed:
+            return None
+        self.port.write(bytes([CMD_STATUS]))
+        queued, free = self.wait(RSP_STATUS)
+        return queued, free
 
-while True:
-    data = sys.stdin.buffer.read()
-    if not data:
-        break
-    speaker.speak(data)
+
+if __name__ == "__main__":
+    speaker = Speaker(sys.argv[1] if len(sys.argv) > 1 else PORT)
+
+    try:
+        while True:
+            data = sys.stdin.buffer.read()
+            if not data:
+                break
+            speaker.speak(data)
+        speaker.flush()
+    except KeyboardInterrupt:
+        speaker.abort()
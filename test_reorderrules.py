@@ -0,0 +1,135 @@
+import random
+import re
+
+import pytest
+
+import text2sp0256
+from reorderrules import (
+    NFA,
+    RegexParser,
+    RuleLanguages,
+    constraints,
+    intersects,
+    outcome,
+    profile,
+    reorder,
+)
+from text2sp0256 import (
+    RULE_TABLE,
+    Text2sp0256,
+    reorder_rule_table,
+    rule_table_digest,
+)
+
+CORPUS = [
+    "HELLO WORLD, THIS IS A TEST.",
+    "THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG!",
+    "AGAIN AND AGAIN, THE ACHE OF EVEN MOVEMENT IS REAL.",
+    "IT'S 42 DEGREES - WHO'S THERE?",
+    "PLEASE READ THE MANUAL BEFORE USING THE DEVICE; ALL OF IT.",
+]
+
+
+@pytest.fixture(scope="module")
+def languages():
+    return RuleLanguages(RULE_TABLE)
+
+
+@pytest.fixture(scope="module")
+def before(languages):
+    return {
+        section: constraints(rules, languages) for section, rules in RULE_TABLE.items()
+    }
+
+
+def adversarial_order(before):
+    # the topological order furthest from the original: always try the last
+    # rule whose prerequisites have all been tried.
+    order = []
+    while len(order) < len(before):
+        order.append(
+            max(
+                j
+                for j, earlier in enumerate(before)
+                if j not in order and earlier <= set(order)
+            )
+        )
+    return order
+
+
+@pytest.mark.parametrize(
+    "pattern", ["A{2}", "A{,2}", "A{1,3}", "A{2,}", "(AB|C){2}", "[^A-Z]A*"]
+)
+def test_regex_parser(languages, pattern):
+    node = ("cat", [RegexParser(pattern, languages.alphabet).parse(), ("end",)])
+    nfa = NFA(node)
+    for s in ["", "A", "AA", "AAA", "AAAA", "ABC", "CAB", " AA", "1"]:
+        expected = re.fullmatch(pattern, s) is not None
+        assert intersects(nfa, NFA(languages.literal(s))) == expected, s
+
+
+def test_adversarial_order_matches_per_position(before):
+    sections = {section: adversarial_order(b) for section, b in before.items()}
+    moved = sum(i != j for order in sections.values() for i, j in enumerate(order))
+    assert moved > 100
+    original = Text2sp0256()
+    reordered = Text2sp0256(
+        reorder_rule_table({"digest": rule_table_digest(), "sections": sections})
+    )
+    rnd = random.Random(0)
+    chars = "".join(RULE_TABLE) + "    AEIOU"
+    for _ in range(3000):
+        input_str = "".join(rnd.choice(chars) for _ in range(rnd.randint(1, 10)))
+        for pos in range(len(input_str)):
+            try:
+                expected = original.match(input_str, pos)
+            except (KeyError, ValueError) as err:
+                with pytest.raises(type(err)):
+                    reordered.match(input_str, pos)
+                continue
+            got = reordered.match(input_str, pos)
+            assert sections[input_str[pos]][got] == expected, (input_str, pos)
+
+
+def test_corpus_equivalence(languages):
+    translator = Text2sp0256()
+    hits, chars = profile(translator, CORPUS)
+    order, old_cost, new_cost = reorder(hits, languages)
+    assert chars == sum(len(line) for line in CORPUS)
+    assert new_cost <= old_cost
+    reordered = Text2sp0256(reorder_rule_table(order))
+    for input_str in CORPUS:
+        assert outcome(translator, input_str) == outcome(reordered, input_str)
+
+
+def test_profile_reordered_translator(before):
+    sections = {section: adversarial_order(b) for section, b in before.items()}
+    order = {"digest": rule_table_digest(), "sections": sections}
+    hits, chars = profile(Text2sp0256(), CORPUS)
+    reordered_hits, reordered_chars = profile(
+        Text2sp0256(reorder_rule_table(order)), CORPUS
+    )
+    assert reordered_chars == chars
+    for section, section_order in sections.items():
+        for new, original in enumerate(section_order):
+            assert reordered_hits[section][new] == hits[section][original]
+
+
+def test_reorder_rule_table_rejects_other_table(monkeypatch):
+    sections = {
+        section: list(range(len(rules))) for section, rules in RULE_TABLE.items()
+    }
+    order = {"digest": rule_table_digest(), "sections": sections}
+    assert reorder_rule_table(order) == RULE_TABLE
+    edited = dict(RULE_TABLE, Z=list(reversed(RULE_TABLE["Z"])))
+    with pytest.raises(ValueError):
+        reorder_rule_table(order, edited)
+    with pytest.raises(ValueError):
+        reorder_rule_table({"digest": rule_table_digest()})
+    sections["Z"] = [0, 0, 1]
+    with pytest.raises(ValueError):
+        reorder_rule_table(order)
+    sections["Z"] = [0, 1, 2]
+    monkeypatch.setitem(text2sp0256.META_RULE_TABLE, "<", r"[^A-Z']")
+    with pytest.raises(ValueError):
+        reorder_rule_table(order)
@@ -0,0 +1,101 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("serial")
+
+from sp0256protocol import BUFFER_SIZE, CMD_HELLO  # noqa: E402
+from sp0256sim import Firmware, open_pty, serve  # noqa: E402
+from speaksp0256 import Speaker  # noqa: E402
+
+DATA = bytes(range(1, 64)) * 3
+
+
+def after_probes(said):
+    # every CMD_HELLO the host sent is also spoken, as PA1.
+    spoken = said.lstrip(bytes([CMD_HELLO]))
+    assert len(spoken) < len(said)
+    return spoken
+
+
+@pytest.fixture
+def connect():
+    threads = []
+
+    def connect(firmware):
+        master, slave = open_pty()
+        stop = threading.Event()
+        thread = threading.Thread(target=serve, args=(firmware, master, None, stop))
+        thread.start()
+        threads.append((thread, stop, master, slave))
+        return Speaker(os.ttyname(slave))
+
+    yield connect
+    for thread, stop, master, slave in threads:
+        stop.set()
+        thread.join()
+        os.close(master)
+        os.close(slave)
+
+
+def test_framed(connect):
+    firmware = Firmware(0.0005)
+    speaker = connect(firmware)
+    assert speaker.framed
+    assert speaker.credits == BUFFER_SIZE
+    speaker.speak(DATA)
+    speaker.flush()
+    assert after_probes(firmware.said) == DATA
+    assert speaker.credits == BUFFER_SIZE
+    assert speaker.spoken == len(DATA)
+    assert not speaker.pending
+    assert speaker.status() == (0, BUFFER_SIZE)
+
+
+def test_legacy(connect):
+    firmware = Firmware(0.0005, legacy=True)
+    speaker = connect(firmware)
+    assert not speaker.framed
+    speaker.speak(DATA)
+    assert after_probes(firmware.said) == DATA
+
+
+def test_original_host_pa1(connect):
+    firmware = Firmware(0.0005)
+    speaker = connect(firmware)
+    # speak byte by byte, as hosts of the original protocol do.
+    speaker.framed = False
+    speaker.speak(bytes([1, CMD_HELLO, 2]))
+    assert after_probes(firmware.said) == bytes([1, CMD_HELLO, 2])
+
+
+def test_resync(connect):
+    firmware = Firmware(0.01)
+    speaker = connect(firmware)
+    speaker.speak(DATA)
+    # the previous host goes away without aborting what it queued.
+    speaker.port.close()
+    speaker = Speaker(speaker.port.port)
+    assert speaker.credits == BUFFER_SIZE
+    assert speaker.status() == (0, BUFFER_SIZE)
+    speaker.speak(bytes([5]) * 10)
+    speaker.flush()
+    assert speaker.spoken == 10
+    assert firmware.said.endswith(bytes([5]) * 10)
+    assert speaker.status() == (0, BUFFER_SIZE)
+
+
+def test_abort(connect):
+    firmware = Firmware(0.01)
+    speaker = connect(firmware)
+    speaker.speak(DATA)
+    queued, free = speaker.status()
+    assert queued and queued + free == BUFFER_SIZE
+    speaker.abort()
+    # the frame being spoken is acknowledged with its partial spoken count.
+    assert 0 < speaker.spoken < len(DATA)
+    assert after_probes(firmware.said) == DATA[: speaker.spoken]
+    assert speaker.credits == BUFFER_SIZE
+    assert not speaker.pending
+    assert speaker.status() == (0, BUFFER_SIZE)
@@ -1,5 +1,8 @@
 #!/usr/bin/env python
 
+import argparse
+import hashlib
+import json
 import re
 import sys
 from functools import cache
@@ -577,10 +580,32 @@ def expand_meta_rule(rule):
     return "".join([META_RULE_TABLE.get(i, i) for i in rule])
 
 
+def rule_table_digest(rule_table=RULE_TABLE):
+    # which rules can be reordered also depends on what the meta rules expand to.
+    return hashlib.sha256(repr((rule_table, META_RULE_TABLE)).encode()).hexdigest()
+
+
+def reorder_rule_table(order, rule_table=RULE_TABLE):
+    # order holds the digest of the rule table it was computed for, and maps
+    # each section to the indices of its rules in the order they should be tried
+    # (see reorderrules.py).
+    if order.get("digest") != rule_table_digest(rule_table):
+        raise ValueError("rule order was computed for a different rule table")
+    if not isinstance(order.get("sections"), dict):
+        raise ValueError("rule order has no sections")
+    reordered = {}
+    for section, rules in rule_table.items():
+        indices = order["sections"].get(section, range(len(rules)))
+        if sorted(indices) != list(range(len(rules))):
+            raise ValueError(f"order for {section!r} is not a permutation of its rules")
+        reordered[section] = [rules[i] for i in indices]
+    return reordered
+
+
 class Text2sp0256:
-    def __init__(self):
+    def __init__(self, rule_table=RULE_TABLE):
         self.RULES = {}
-        for section, rules in RULE_TABLE.items():
+        for section, rules in rule_table.items():
             self.RULES[section] = []
             for a_rules, b_rules, c_rules, allophones in rules:
                 if a_rules:
@@ -593,34 +618,48 @@ class Text2sp0256:
                     c_rules = None
                 self.RULES[section].append((a_rules, b_rules, c_rules, allophones))
 
+    def match(self, input_str, pos):
+        # index of the first rule in input_str[pos]'s section that matches at pos.
+        rules = self.RULES[input_str[pos]]
+        for i, (a_rules, b_rules, c_rules, _) in enumerate(rules):
+            if not input_str[pos:].startswith(b_rules):
+                continue
+            if a_rules:
+                if not a_rules.match(input_str[:pos]):
+                    continue
+            if c_rules:
+                if not c_rules.match(input_str[pos + len(b_rules) :]):
+                    continue
+            return i
+        raise ValueError
+
     def translate(self, input_str):
         pos = 0
         output = []
 
         while pos < len(input_str):
-            rules = self.RULES[input_str[pos]]
-            pos_allophones = None
-            for a_rules, b_rules, c_rules, allophones in rules:
-                if not input_str[pos:].startswith(b_rules):
-                    continue
-                if a_rules:
-                    if not a_rules.match(input_str[:pos]):
-                        continue
-                if c_rules:
-                    if not c_rules.match(input_str[pos + len(b_rules) :]):
-                        continue
-                pos_allophones = allophones
-                pos += len(b_rules)
-                break
-            if pos_allophones is None:
-                raise ValueError
-            output.extend(pos_allophones)
+            _, b_rules, _, allophones = self.RULES[input_str[pos]][
+                self.match(input_str, pos)
+            ]
+            pos += len(b_rules)
+            output.extend(allophones)
         output.append("PA3")
         return output
 
 
-translator = Text2sp0256()
-input_str = " ".join([line.upper().strip() for line in sys.stdin])
-translated = bytes([ALLOPHONES[b] for b in translator.translate(input_str)])
-sys.stdout.buffer.write(translated)
-sys.stdout.flush()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="translate text to SP0256 allophones")
+    parser.add_argument(
+        "--order",
+        help="JSON rule order from reorderrules.py to try rules in",
+    )
+    args = parser.parse_args()
+    rule_table = RULE_TABLE
+    if args.order:
+        with open(args.order) as f:
+            rule_table = reorder_rule_table(json.load(f))
+    translator = Text2sp0256(rule_table)
+    input_str = " ".join([line.upper().strip() for line in sys.stdin])
+    translated = bytes([ALLOPHONES[b] for b in translator.translate(input_str)])
+    sys.stdout.buffer.write(translated)
+    sys.stdout.flush()